@@ -2,6 +2,14 @@
 import json
 import csv
 import io
+import os
+import bisect
+import heapq
+import unicodedata
+import sys
+from array import array
+import threading
+from collections import OrderedDict
 from flask import Flask, request, jsonify, Response
 from datetime import datetime
 import requests
@@ -11,6 +19,109 @@ from flask_cors import CORS
 app = Flask(__name__)
 CORS(app)
 
+# Upstream Open-Meteo endpoints; overridable so the app can be pointed at a local stub.
+GEOCODING_API_URL = os.environ.get("GEOCODING_API_URL", "https://geocoding-api.open-meteo.com/v1/search")
+ARCHIVE_API_URL = os.environ.get("ARCHIVE_API_URL", "https://archive-api.open-meteo.com/v1/archive")
+
+# --- OFFLINE GAZETTEER ---
+# Optional local place index built from a GeoNames dump (cities15000.txt, allCountries.txt, ...
+# from https://download.geonames.org/export/dump/). Set GAZETTEER_PATH to enable it;
+# without it every lookup goes to the Open-Meteo geocoding API as before.
+GAZETTEER_PATH = os.environ.get("GAZETTEER_PATH")
+AUTOCOMPLETE_MAX_RESULTS = 50
+SHORT_PREFIX_LENGTH = 2
+
+def normalize_place_name(name):
+    """Lowercases, strips accents and collapses whitespace so 'São  Paulo' matches 'sao paulo'."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(without_accents.casefold().split())
+
+class Gazetteer:
+    """
+    In-memory index of populated places. Place fields are kept in parallel arrays and
+    names in one sorted list, so exact lookups and prefix searches are a binary search
+    away; ties are ranked by population. The top places for 1-2 character prefixes are
+    precomputed so the first keystrokes don't scan a large slice of the index.
+    """
+    def __init__(self, rows):
+        """`rows` yields (name, ascii_name, latitude, longitude, country_code, population)."""
+        self.names, self.country_codes = [], []
+        self.latitudes, self.longitudes, self.populations = array("d"), array("d"), array("q")
+        entries, short_prefix_heaps = [], {}
+        for idx, (name, ascii_name, latitude, longitude, country_code, population) in enumerate(rows):
+            self.names.append(name); self.country_codes.append(sys.intern(country_code))
+            self.latitudes.append(latitude); self.longitudes.append(longitude); self.populations.append(population)
+            keys = {normalize_place_name(name), normalize_place_name(ascii_name)} - {""}
+            entries.extend((key, -population, idx) for key in keys)
+            for prefix in {key[:length] for key in keys for length in range(1, SHORT_PREFIX_LENGTH + 1)}:
+                heap = short_prefix_heaps.setdefault(prefix, [])
+                if len(heap) < AUTOCOMPLETE_MAX_RESULTS: heapq.heappush(heap, (population, -idx))
+                else: heapq.heappushpop(heap, (population, -idx))
+        entries.sort()
+        self._keys = [key for key, _, _ in entries]
+        self._place_ids = array("l", (idx for _, _, idx in entries))
+        self._short_prefix_top = {prefix: [-neg_idx for _, neg_idx in sorted(heap, reverse=True)]
+                                  for prefix, heap in short_prefix_heaps.items()}
+
+    @classmethod
+    def from_geonames(cls, path):
+        """
+        Loads a tab-separated GeoNames 'geoname' table (cities*.txt or allCountries.txt).
+        Only populated places (feature class P) are indexed.
+        """
+        def rows():
+            with open(path, encoding="utf-8") as dump:
+                for line in dump:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) < 15 or fields[6] != "P": continue
+                    try: yield fields[1], fields[2], float(fields[4]), float(fields[5]), fields[8], int(fields[14] or 0)
+                    except ValueError: continue
+        return cls(rows())
+
+    def place(self, idx):
+        return {"name": self.names[idx], "country_code": self.country_codes[idx], "latitude": self.latitudes[idx],
+                "longitude": self.longitudes[idx], "population": self.populations[idx]}
+
+    def _range(self, key, prefix):
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_right(self._keys, key + "\uffff") if prefix else bisect.bisect_right(self._keys, key)
+        return start, end
+
+    def resolve(self, location_name):
+        """
+        Returns the most populous place named exactly `location_name`, or None.
+        "Paris, FR" style input is restricted to that country code; any other
+        qualifier ("Paris, Texas") can't be checked locally, so it returns None
+        and the caller falls back to the remote geocoder.
+        """
+        start, end = self._range(normalize_place_name(location_name), prefix=False)
+        if start < end: return self.place(self._place_ids[start])
+        head, comma, qualifier = location_name.partition(",")
+        if not comma: return None
+        qualifier = qualifier.strip().upper()
+        start, end = self._range(normalize_place_name(head), prefix=False)
+        for i in range(start, end):
+            if self.country_codes[self._place_ids[i]] == qualifier: return self.place(self._place_ids[i])
+        return None
+
+    def autocomplete(self, prefix, limit=10):
+        """Returns up to `limit` places whose name starts with `prefix`, most populous first."""
+        key = normalize_place_name(prefix)
+        if not key: return []
+        if len(key) <= SHORT_PREFIX_LENGTH:
+            top_ids = self._short_prefix_top.get(key, [])[:limit]
+        else:
+            start, end = self._range(key, prefix=True)
+            top_ids = heapq.nlargest(limit, set(self._place_ids[start:end]), key=self.populations.__getitem__)
+        return [self.place(idx) for idx in top_ids]
+
+gazetteer = Gazetteer.from_geonames(GAZETTEER_PATH) if GAZETTEER_PATH else None
+
+# Limits for a day to count as hot/cold (°C), windy (km/h) or rainy (mm).
+# Part of the analysis cache key, so changing them invalidates cached results.
+THRESHOLDS = {"hot": 32.0, "cold": 10.0, "windy": 35.0, "rainy": 1.0}
+
 # --- (COMPLETE) ANALYSIS FUNCTION ---
 # This function remains unchanged as its logic is used by both endpoints.
 def analyze_data(weather_data, target_date_str):
@@ -18,7 +129,6 @@ def analyze_data(weather_data, target_date_str):
     Analyzes historical weather data to calculate overall probabilities, averages,
     and collects data from the last 10 years for trend graphing.
     """
-    THRESHOLDS = {"hot": 32.0, "cold": 10.0, "windy": 35.0, "rainy": 1.0}
     counters = {"matching_days": 0, "hot_days": 0, "cold_days": 0, "windy_days": 0, "rainy_days": 0, "any_rain_days": 0}
     daily_temps, daily_humidity, daily_wind_speeds = [], [], []
     yearly_data = {} # To store data for the graph trends
@@ -86,22 +196,86 @@ def get_nasa_image_url(latitude, longitude, date_str):
         return f"{base_url}{formatted_date}/250m/{bbox}?format=image/jpeg"
     except Exception: return None
 """
-def get_historical_weather(location_name):
+def search_remote_places(query, count=1):
+    """Queries the Open-Meteo geocoding API and returns its list of matches (may be empty)."""
+    params = {"name": query, "count": count, "language": "en", "format": "json"}
+    geo_response = requests.get(GEOCODING_API_URL, params=params, timeout=10); geo_response.raise_for_status()
+    return geo_response.json().get("results") or []
+
+def get_archive_years():
+    """The 20-year window fetched from the archive; it moves forward once a year."""
+    end_year = datetime.now().year - 1
+    return end_year - 20, end_year
+
+# Memo of place name -> (latitude, longitude) so repeat searches and cache hits
+# don't pay a geocoding round trip. Bounded LRU; failed lookups are not stored.
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", 1024))
+geocode_cache = OrderedDict()
+geocode_cache_lock = threading.Lock()
+
+def geocode_location(location_name):
+    """Returns (latitude, longitude, error) for a place name."""
+    cache_key = normalize_place_name(location_name)
+    with geocode_cache_lock:
+        if cache_key in geocode_cache:
+            geocode_cache.move_to_end(cache_key)
+            return (*geocode_cache[cache_key], None)
+    # Local gazetteer first; the remote geocoder is only hit when it has no match.
+    place = gazetteer.resolve(location_name) if gazetteer else None
+    if place is None:
+        remote_results = search_remote_places(location_name)
+        if not remote_results: return None, None, f"Could not find coordinates for '{location_name}'"
+        place = remote_results[0]
+    with geocode_cache_lock:
+        geocode_cache[cache_key] = (place["latitude"], place["longitude"])
+        geocode_cache.move_to_end(cache_key)
+        while len(geocode_cache) > GEOCODE_CACHE_SIZE: geocode_cache.popitem(last=False)
+    return place["latitude"], place["longitude"], None
+
+def fetch_archive(latitude, longitude):
+    start_year, end_year = get_archive_years()
+    daily_params = "weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max,relative_humidity_2m_mean"
+    params = {"latitude": latitude, "longitude": longitude, "start_date": f"{start_year}-01-01", "end_date": f"{end_year}-12-31", "daily": daily_params, "timezone": "auto"}
+    response = requests.get(ARCHIVE_API_URL, params=params, timeout=30); response.raise_for_status()
+    return response.json()
+
+def describe_request_error(e):
+    if isinstance(e, requests.exceptions.HTTPError):
+        if e.response.status_code == 429: return "API rate limit exceeded."
+        return f"HTTP Error: {e}"
+    return f"Network error: {e}"
+
+# --- ANALYSIS RESULT CACHE ---
+# Memoizes analyze_data output so /analyze followed by /download_csv (or repeat
+# searches) only pays for the archive download once. Keyed by resolved coordinates,
+# month-day, thresholds and archive window; bounded LRU.
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 256))
+analysis_cache = OrderedDict()
+analysis_cache_lock = threading.Lock()
+
+def get_analysis(location_name, date_str):
+    """
+    Returns (analysis, latitude, longitude, cache_hit, error). The location is resolved
+    first (usually from the geocode memo) since the cache is keyed by coordinates; the
+    archive fetch and analysis are skipped on a hit.
+    """
     try:
-        geocoding_url = f"https://geocoding-api.open-meteo.com/v1/search?name={location_name}&count=1&language=en&format=json"
-        geo_response = requests.get(geocoding_url, timeout=10); geo_response.raise_for_status(); geo_data = geo_response.json()
-        if not geo_data.get("results"): return None, None, None, f"Could not find coordinates for '{location_name}'"
-        result = geo_data["results"][0]; latitude, longitude = result["latitude"], result["longitude"]
-        historical_api_url = "https://archive-api.open-meteo.com/v1/archive"
-        end_year = datetime.now().year - 1; start_year = end_year - 20
-        daily_params = "weather_code,temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max,relative_humidity_2m_mean"
-        params = {"latitude": latitude, "longitude": longitude, "start_date": f"{start_year}-01-01", "end_date": f"{end_year}-12-31", "daily": daily_params, "timezone": "auto"}
-        response = requests.get(historical_api_url, params=params, timeout=30); response.raise_for_status()
-        return response.json(), latitude, longitude, None
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 429: return None, None, None, "API rate limit exceeded."
-        return None, None, None, f"HTTP Error: {e}"
-    except requests.exceptions.RequestException as e: return None, None, None, f"Network error: {e}"
+        latitude, longitude, error = geocode_location(location_name)
+        if error: return None, None, None, False, error
+        target_date = datetime.strptime(date_str, '%Y-%m-%d')
+        cache_key = (round(latitude, 4), round(longitude, 4), target_date.month, target_date.day,
+                     tuple(sorted(THRESHOLDS.items())), get_archive_years())
+        with analysis_cache_lock:
+            if cache_key in analysis_cache:
+                analysis_cache.move_to_end(cache_key)
+                return analysis_cache[cache_key], latitude, longitude, True, None
+        analysis = analyze_data(fetch_archive(latitude, longitude), date_str)
+    except requests.exceptions.RequestException as e: return None, None, None, False, describe_request_error(e)
+    with analysis_cache_lock:
+        analysis_cache[cache_key] = analysis
+        analysis_cache.move_to_end(cache_key)
+        while len(analysis_cache) > ANALYSIS_CACHE_SIZE: analysis_cache.popitem(last=False)
+    return analysis, latitude, longitude, False, None
 
 # --- FLASK ROUTE #1: Get analysis for web display ---
 @app.route('/analyze', methods=['POST'])
@@ -110,11 +284,13 @@ def analyze_weather():
     if not data: return jsonify({"error": "Invalid JSON"}), 400
     location, date_str = data.get('location'), data.get('date')
     if not location or not date_str: return jsonify({"error": "Location and date are required"}), 400
-    weather_data, lat, lon, error = get_historical_weather(location)
+    analysis, lat, lon, cache_hit, error = get_analysis(location, date_str)
     if error: return jsonify({"error": error}), 503 if "rate limit" in error else 500
-    analysis = analyze_data(weather_data, date_str)
     #nasa_url = get_nasa_image_url(lat, lon, date_str)
-    return jsonify({"location": location, "requested_date": date_str, "weather_analysis": analysis, "nasa_satellite_view_url": nasa_url})
+    nasa_url = None
+    response = jsonify({"location": location, "requested_date": date_str, "weather_analysis": analysis, "nasa_satellite_view_url": nasa_url, "cache_hit": cache_hit})
+    response.headers["X-Analysis-Cache"] = "HIT" if cache_hit else "MISS"
+    return response
 
 # --- (NEW) FLASK ROUTE #2: Get analysis as a downloadable CSV file ---
 @app.route('/download_csv', methods=['POST'])
@@ -124,10 +300,9 @@ def download_csv():
     location, date_str = data.get('location'), data.get('date')
     if not location or not date_str: return jsonify({"error": "Location and date are required"}), 400
     
-    weather_data, _, _, error = get_historical_weather(location)
+    analysis, _, _, cache_hit, error = get_analysis(location, date_str)
     if error: return jsonify({"error": error}), 503 if "rate limit" in error else 500
     
-    analysis = analyze_data(weather_data, date_str)
     if 'error' in analysis: return jsonify(analysis), 404
 
     # Create an in-memory text file
@@ -156,9 +331,30 @@ def download_csv():
     return Response(
         output,
         mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment;filename=weather_analysis_{location.lower()}.csv"}
+        headers={"Content-Disposition": f"attachment;filename=weather_analysis_{location.lower()}.csv",
+                 "X-Analysis-Cache": "HIT" if cache_hit else "MISS"}
     )
 
+# --- FLASK ROUTE #3: Place name suggestions for the search box ---
+@app.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    query = request.args.get('q', '').strip()
+    if not query: return jsonify({"error": "Query parameter 'q' is required"}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), AUTOCOMPLETE_MAX_RESULTS))
+    places = gazetteer.autocomplete(query, limit) if gazetteer else []
+    source = "local"
+    if not places:
+        try: places = search_remote_places(query, count=limit)
+        except requests.exceptions.RequestException as e:
+            error = describe_request_error(e)
+            return jsonify({"error": error}), 503 if "rate limit" in error else 500
+        source = "remote"
+    suggestions = [{
+        "name": place["name"], "country_code": place.get("country_code"),
+        "latitude": place["latitude"], "longitude": place["longitude"], "population": place.get("population")
+    } for place in places]
+    return jsonify({"query": query, "source": source, "results": suggestions})
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,284 @@
+# loadtest.py
+"""
+Load-test harness for the /analyze endpoint.
+
+Starts a local fake of the Open-Meteo geocoding and archive APIs, points
+app_final at it, serves the Flask app on a local port and replays a
+location/date mix against it from a pool of client threads. Prints a JSON
+report (throughput, latency percentiles, upstream call counts, peak RSS)
+that can be saved and compared with a later run:
+
+    python loadtest.py --requests 500 --concurrency 16 --output before.json
+    python loadtest.py --requests 500 --concurrency 16 --compare before.json
+
+Peak RSS is reported once for the whole run and process, so it includes the
+stub and the client threads as well as the app. Compare it only between runs
+with the same --scenarios.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+DEFAULT_LOCATIONS = ["Paris", "London", "New York", "Tokyo", "Sao Paulo", "Sydney", "Cairo", "Toronto"]
+DEFAULT_DATES = ["2025-01-15", "2025-04-01", "2025-07-04", "2025-10-31", "2025-12-25"]
+SCENARIOS = ["cold", "warm", "mixed"]
+WARMUP_ATTEMPTS = 10  # per mix entry; priming retries 429s so "warm" really starts warm
+
+# --- FAKE OPEN-METEO UPSTREAM ---
+class UpstreamStub:
+    """Serves /v1/search and /v1/archive with configurable latency, payload size and 429 rate."""
+    def __init__(self, latency_ms=50.0, payload_years=21, rate_limit_ratio=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.archive_body = json.dumps(build_archive_payload(payload_years)).encode()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def reset_counts(self):
+        with self.lock: self.counts = {"geocoding": 0, "archive": 0, "rate_limited": 0}
+
+    def _count(self, key):
+        with self.lock: self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _should_rate_limit(self):
+        with self.lock: return self.random.random() < self.rate_limit_ratio
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                time.sleep(stub.latency_ms / 1000.0)
+                if url.path == "/v1/search":
+                    stub._count("geocoding")
+                    name = parse_qs(url.query).get("name", [""])[0]
+                    body = json.dumps({"results": [fake_place(name)]}).encode()
+                elif url.path == "/v1/archive":
+                    stub._count("archive")
+                    body = stub.archive_body
+                else:
+                    return self.send_error(404)
+                if stub._should_rate_limit():
+                    stub._count("rate_limited")
+                    return self.send_error(429)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def fake_place(name):
+    """Deterministic coordinates per name so cache keys are stable across runs."""
+    digest = hashlib.sha1(name.strip().lower().encode()).digest()
+    latitude = round(digest[0] / 255 * 140 - 70, 4)
+    longitude = round(digest[1] / 255 * 340 - 170, 4)
+    return {"name": name, "latitude": latitude, "longitude": longitude, "country_code": "XX", "population": 0}
+
+def build_archive_payload(years):
+    """Daily series shaped like the archive API response, `years` years long."""
+    rng = random.Random(years)
+    start = date(date.today().year - years, 1, 1)
+    daily = {key: [] for key in ("time", "weather_code", "temperature_2m_max", "temperature_2m_min",
+                                 "precipitation_sum", "wind_speed_10m_max", "relative_humidity_2m_mean")}
+    day = start
+    while day.year < date.today().year:
+        daily["time"].append(day.isoformat())
+        daily["weather_code"].append(rng.choice([0, 1, 2, 3, 61, 63]))
+        daily["temperature_2m_max"].append(round(rng.uniform(5, 38), 1))
+        daily["temperature_2m_min"].append(round(rng.uniform(-5, 22), 1))
+        daily["precipitation_sum"].append(round(max(0.0, rng.gauss(1.0, 3.0)), 1))
+        daily["wind_speed_10m_max"].append(round(rng.uniform(0, 60), 1))
+        daily["relative_humidity_2m_mean"].append(rng.randint(20, 100))
+        day += timedelta(days=1)
+    return {"latitude": 0.0, "longitude": 0.0, "daily": daily}
+
+# --- LOAD GENERATION ---
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values: return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def peak_rss_kb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage  # macOS reports bytes
+
+def run_scenario(name, app_module, app_url, stub, mix, total_requests, concurrency, seed, cache_size, geocode_cache_size):
+    """Replays `total_requests` picks from `mix` against /analyze and returns the stats."""
+    rng = random.Random(seed)
+    workload = [rng.choice(mix) for _ in range(total_requests)]
+    session_local = threading.local()
+
+    app_module.analysis_cache.clear()
+    app_module.geocode_cache.clear()
+    # cold: every request misses the geocode and analysis caches; warm: they are primed with the whole mix first.
+    app_module.ANALYSIS_CACHE_SIZE = 0 if name == "cold" else cache_size
+    app_module.GEOCODE_CACHE_SIZE = 0 if name == "cold" else geocode_cache_size
+    primed = 0
+    if name == "warm":
+        for location, date_str in mix:
+            for _ in range(WARMUP_ATTEMPTS):
+                try:
+                    response = requests.post(f"{app_url}/analyze", json={"location": location, "date": date_str}, timeout=60)
+                except requests.exceptions.RequestException:
+                    continue
+                if response.status_code == 200:
+                    primed += 1
+                    break
+    stub.reset_counts()
+
+    def send(item):
+        if not hasattr(session_local, "session"): session_local.session = requests.Session()
+        location, date_str = item
+        started = time.perf_counter()
+        try:
+            response = session_local.session.post(f"{app_url}/analyze", json={"location": location, "date": date_str}, timeout=60)
+            status, cache = response.status_code, response.headers.get("X-Analysis-Cache")
+        except requests.exceptions.RequestException:
+            status, cache = "connection_error", None
+        return (time.perf_counter() - started) * 1000, status, cache
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(send, workload))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _, _ in results)
+    statuses = {}
+    for _, status, _ in results: statuses[str(status)] = statuses.get(str(status), 0) + 1
+    stats = {
+        "requests": total_requests,
+        "errors": sum(count for status, count in statuses.items() if status != "200"),
+        "status_counts": statuses,
+        "cache_hits": sum(1 for _, _, cache in results if cache == "HIT"),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total_requests / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "p95": round(percentile(latencies, 95), 2) if latencies else None,
+            "p99": round(percentile(latencies, 99), 2) if latencies else None,
+            "max": round(latencies[-1], 2) if latencies else None,
+        },
+        "upstream_calls": dict(stub.counts),
+    }
+    if name == "warm": stats["primed_entries"] = {"primed": primed, "mix_size": len(mix)}
+    return stats
+
+def compare_reports(baseline, current):
+    """Relative change of the headline numbers, per scenario and overall (positive = current is higher)."""
+    def change(old, new):
+        if old in (None, 0) or new is None: return None
+        return round((new - old) / old * 100, 1)
+    deltas = {}
+    for name, stats in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old: continue
+        deltas[name] = {
+            "throughput_rps_pct": change(old["throughput_rps"], stats["throughput_rps"]),
+            "p50_pct": change(old["latency_ms"]["p50"], stats["latency_ms"]["p50"]),
+            "p95_pct": change(old["latency_ms"]["p95"], stats["latency_ms"]["p95"]),
+            "p99_pct": change(old["latency_ms"]["p99"], stats["latency_ms"]["p99"]),
+        }
+    return {"scenarios": deltas, "peak_rss_kb_pct": change(baseline.get("peak_rss_kb"), current["peak_rss_kb"])}
+
+def load_mix(args):
+    if args.mix:
+        with open(args.mix, encoding="utf-8") as mix_file:
+            return [(entry["location"], entry["date"]) for entry in json.load(mix_file)]
+    return [(location, date_str) for location in args.locations.split(",") for date_str in args.dates.split(",")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test /analyze against a local Open-Meteo stub.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of cold,warm,mixed")
+    parser.add_argument("--locations", default=",".join(DEFAULT_LOCATIONS))
+    parser.add_argument("--dates", default=",".join(DEFAULT_DATES))
+    parser.add_argument("--mix", help='JSON file with [{"location": ..., "date": ...}, ...]; overrides --locations/--dates')
+    parser.add_argument("--upstream-latency-ms", type=float, default=50.0)
+    parser.add_argument("--payload-years", type=int, default=21, help="years of daily data in each archive response")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="fraction of upstream calls answered with 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    args = parser.parse_args(argv)
+    scenarios = args.scenarios.split(",")
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown: parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    stub = UpstreamStub(args.upstream_latency_ms, args.payload_years, args.rate_limit_ratio, args.seed)
+    stub.start()
+    # app_final reads its upstream URLs at import time, so set them first.
+    os.environ["GEOCODING_API_URL"] = f"{stub.base_url}/v1/search"
+    os.environ["ARCHIVE_API_URL"] = f"{stub.base_url}/v1/archive"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app_final as app_module
+    from werkzeug.serving import make_server
+    cache_size, geocode_cache_size = app_module.ANALYSIS_CACHE_SIZE, app_module.GEOCODE_CACHE_SIZE
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # one access-log line per request skews timings
+
+    app_server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+    app_url = f"http://127.0.0.1:{app_server.server_port}"
+
+    mix = load_mix(args)
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "scenarios": {},
+    }
+    try:
+        for index, name in enumerate(scenarios):
+            report["scenarios"][name] = run_scenario(name, app_module, app_url, stub, mix,
+                                                     args.requests, args.concurrency, args.seed + index, cache_size, geocode_cache_size)
+    finally:
+        app_server.shutdown()
+        stub.stop()
+    # ru_maxrss is a process-wide high-water mark, so it is only meaningful for the run as a whole.
+    report["peak_rss_kb"] = peak_rss_kb()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            report["comparison"] = compare_reports(json.load(baseline_file), report)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as report_file: report_file.write(output + "\n")
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()